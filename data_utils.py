@@ -0,0 +1,229 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.feather as feather
+import os
+import tempfile
+from functools import lru_cache, partial
+
+# --- Source Schemas ---
+# Both UCI Online Retail exports share one cleaning pipeline. Each schema maps
+# its own column names onto the canonical ones used by the dashboard. Only
+# 'online_retail_ii' is used by the dashboard today; 'online_retail' (for
+# Online_Retail.csv) has no caller and is exercised only when a caller passes
+# schema='online_retail' to load_retail.
+SALES_COLUMN_TYPES = {
+    'Invoice': pa.string(),
+    'StockCode': pa.string(),
+    'Description': pa.string(),
+    'Quantity': pa.int32(),
+    'InvoiceDate': pa.timestamp('ns'),
+    'Price': pa.float64(),
+    'Customer ID': pa.float32(),
+    'Country': pa.string(),
+}
+
+# Bump whenever _clean_sales_data changes its output; it is part of the
+# on-disk cache filename, so older cache files are simply not picked up.
+SALES_PIPELINE_VERSION = 6
+
+SCHEMAS = {
+    'online_retail_ii': {
+        'columns': {},
+        'date_format': None,
+    },
+    'online_retail': {
+        'columns': {'InvoiceNo': 'Invoice', 'UnitPrice': 'Price', 'CustomerID': 'Customer ID'},
+        'date_format': '%m/%d/%y %H:%M',
+    },
+}
+
+# --- Loading and Cleaning ---
+@lru_cache(maxsize=4)
+def _raw_head(file_path, mtime, n):
+    return pd.read_csv(file_path, encoding='ISO-8859-1', nrows=n)
+
+def load_raw_head(file_path, n=100):
+    """
+    Reads only the first n rows of the raw CSV for the preview table. The
+    result is memoized on (path, mtime, n) for the life of the process, since
+    this module is imported once and not re-executed on Streamlit reruns; a
+    newer file on disk gets a new key.
+    """
+    return _raw_head(file_path, os.path.getmtime(file_path), n)
+
+def _load_cached(csv_path, clean, cache_tag):
+    """
+    Returns the cleaned frame for csv_path, using a sibling uncompressed
+    Feather file as an on-disk cache that survives app restarts and can be
+    memory-mapped. cache_tag is part of the cache filename and identifies the
+    schema and pipeline version that produced it, so a change to either reads
+    from a fresh file. The Feather copy is rebuilt whenever the CSV is newer or
+    the cached file cannot be read, and is written to a temporary file first
+    so an interrupted write never leaves a truncated cache behind.
+    """
+    cache_path = f"{os.path.splitext(csv_path)[0]}.{cache_tag}.feather"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        try:
+            return feather.read_table(cache_path, memory_map=True, use_threads=True).to_pandas()
+        except (OSError, pa.ArrowException):
+            # Unreadable cache (e.g. left over from a crash); rebuild it below.
+            pass
+    df = clean(csv_path)
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or '.', suffix='.tmp')
+        os.close(fd)
+        df.to_feather(tmp_path, compression='uncompressed')
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Read-only deployments simply skip the on-disk cache.
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
+
+def _clean_sales_data(file_path, schema):
+    """
+    Parses a raw sales CSV laid out as described by schema and applies the
+    cleaning pipeline. The result always uses the canonical column names.
+    """
+    renames = SCHEMAS[schema]['columns']
+    source_names = {canonical: source for source, canonical in renames.items()}
+    column_types = {source_names.get(col, col): typ for col, typ in SALES_COLUMN_TYPES.items()}
+    date_format = SCHEMAS[schema]['date_format']
+    table = pv.read_csv(
+        file_path,
+        read_options=pv.ReadOptions(encoding='ISO-8859-1', block_size=16 << 20),
+        convert_options=pv.ConvertOptions(
+            include_columns=list(column_types),
+            column_types=column_types,
+            timestamp_parsers=[date_format] if date_format else None
+        )
+    )
+    df = table.to_pandas().rename(columns=renames)
+    df.dropna(subset=['Customer ID'], inplace=True)
+    df = df[df['Quantity'] > 0]
+    df = df[df['Price'] > 0]
+    df['InvoiceMonth'] = df['InvoiceDate'].dt.to_period('M')
+    df['Hour'] = df['InvoiceDate'].dt.hour.astype('int8')
+    # 0 = Monday ... 6 = Sunday; names are attached only to the aggregated rows.
+    df['DayOfWeek'] = df['InvoiceDate'].dt.dayofweek.astype('int8')
+
+    # Narrow dtypes to cut memory and bandwidth in the groupbys and filters.
+    # TotalPrice stays float64 because it is summed into the revenue KPI, so it
+    # is computed before Price is narrowed.
+    df['Customer ID'] = df['Customer ID'].astype('int32')
+    df['Quantity'] = df['Quantity'].astype('int32')
+    df['TotalPrice'] = df['Quantity'].to_numpy() * df['Price'].to_numpy()
+    df['Price'] = df['Price'].astype('float32')
+    for col in ('Country', 'Description', 'StockCode', 'Invoice'):
+        df[col] = df[col].astype('category')
+    return df
+
+def build_cubes(df):
+    """
+    Pre-aggregates the sales data per country so that country filters only
+    need to slice and re-sum these small tables. Orders and customers are
+    kept as per-country sets of IDs because they are not additive across
+    countries. The 'all' entry holds the summary for the default
+    every-country selection, produced by the same reduction as
+    summarize_selection.
+    """
+    # One narrow, contiguous projection shared by every groupby below.
+    viz = df[['Country', 'InvoiceMonth', 'DayOfWeek', 'Description', 'TotalPrice', 'Quantity', 'Customer ID']].copy()
+    viz['Invoice'] = df['Invoice'].cat.codes
+    cubes = {
+        'monthly': viz.groupby(['Country', 'InvoiceMonth'], observed=True)['TotalPrice'].sum(),
+        'daily': viz.groupby(['Country', 'DayOfWeek'], observed=True)['TotalPrice'].sum(),
+        'products': viz.groupby(['Country', 'Description'], observed=True)['Quantity'].sum(),
+        'kpi': viz.groupby('Country', observed=True).agg(
+            revenue=('TotalPrice', 'sum'),
+            items=('Quantity', 'sum'),
+            invoices=('Invoice', 'unique'),
+            customers=('Customer ID', 'unique')
+        ),
+    }
+    cubes['all'] = _summarize(cubes, viz['Country'].cat.categories)
+    return cubes
+
+@st.cache_resource
+def _load_retail(file_path, schema, mtime, size):
+    """
+    Cached body of load_retail; mtime and size only feed the cache key.
+    Cached as a resource, so the returned dict is shared, not copied.
+    """
+    try:
+        df = _load_cached(
+            file_path,
+            partial(_clean_sales_data, schema=schema),
+            f"{schema}.v{SALES_PIPELINE_VERSION}"
+        )
+        return {
+            'key': (file_path, schema, mtime, size),
+            'df': df,
+            'countries': tuple(df['Country'].cat.categories),
+            'cubes': build_cubes(df),
+        }
+    except Exception as e:
+        st.error(f"Error loading sales data from '{file_path}': {e}")
+        return None
+
+def load_retail(file_path, schema='online_retail_ii'):
+    """
+    Loads, cleans, and pre-aggregates a sales CSV. Returns a dict with the
+    frame ('df'), its sorted countries ('countries'), the per-country cubes
+    ('cubes') and a hashable identity for the loaded file ('key'), or None if
+    loading failed. The cache is keyed on the file's mtime and size, and every
+    caller of the same file gets the same shared instance, so callers must
+    treat it as read-only.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        st.error(f"Error loading sales data from '{file_path}': {e}")
+        return None
+    return _load_retail(file_path, schema, stat.st_mtime, stat.st_size)
+
+def _summarize(cubes, selected_countries):
+    """
+    Reduces the country cubes to the KPIs and chart series for one selection.
+    """
+    selected = list(selected_countries)
+    kpis = cubes['kpi'].loc[selected]
+    return {
+        'revenue': kpis['revenue'].sum(),
+        'orders': len(np.unique(np.concatenate(kpis['invoices'].tolist()))),
+        'customers': len(np.unique(np.concatenate(kpis['customers'].tolist()))),
+        'items': kpis['items'].sum(),
+        'monthly': cubes['monthly'].loc[selected].groupby(level='InvoiceMonth', observed=True, sort=True).sum(),
+        'products': cubes['products'].loc[selected].groupby(level='Description', observed=True).sum().nlargest(10),
+        'daily': cubes['daily'].loc[selected].groupby(level='DayOfWeek', sort=True).sum(),
+    }
+
+@st.cache_data
+def summarize_selection(_cubes, source_key, selected_countries):
+    """
+    Cached _summarize for one selection. Keyed on the source key and the
+    sorted selection tuple, so reruns triggered by unrelated widgets reuse the
+    previous result.
+    """
+    return _summarize(_cubes, selected_countries)
+
+def filter_preview(df, selected_countries, columns, n=100):
+    """
+    Returns the first n rows for the selected countries, restricted to
+    columns. The country mask compares integer category codes, and only the
+    rows that are actually shown get materialized.
+    """
+    country_cat = df['Country'].cat
+    if len(selected_countries) == len(country_cat.categories):
+        rows = np.arange(min(n, len(df)))
+    else:
+        selected_codes = np.asarray(
+            [country_cat.categories.get_loc(c) for c in selected_countries],
+            dtype=country_cat.codes.dtype
+        )
+        rows = np.flatnonzero(np.isin(country_cat.codes.to_numpy(), selected_codes))[:n]
+    return df.iloc[rows][list(columns)]
@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import datetime as dt
+from data_utils import load_retail, summarize_selection, filter_preview, load_raw_head
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -11,31 +13,11 @@ st.set_page_config(
 )
 
 # --- Caching Functions for Data Loading ---
-@st.cache_data
-def load_sales_data(file_path):
-    """
-    Loads, cleans, and preprocesses the main sales data.
-    """
-    try:
-        df = pd.read_csv(file_path, encoding='ISO-8859-1')
-        df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
-        df.dropna(subset=['Customer ID'], inplace=True)
-        df['Customer ID'] = df['Customer ID'].astype(int)
-        df = df[df['Quantity'] > 0]
-        df = df[df['Price'] > 0]
-        df['TotalPrice'] = df['Quantity'] * df['Price']
-        df['InvoiceMonth'] = df['InvoiceDate'].dt.to_period('M').astype(str)
-        df['Hour'] = df['InvoiceDate'].dt.hour
-        df['DayOfWeek'] = df['InvoiceDate'].dt.day_name()
-        return df
-    except Exception as e:
-        st.error(f"Error loading sales data from '{file_path}': {e}")
-        return None
-
 @st.cache_data
 def load_rfm_data(file_path):
     """
-    Loads the RFM segmentation data.
+    Loads the RFM segmentation data along with a per-segment summary
+    (customer count, mean frequency, total monetary value) built in one pass.
     """
     try:
         rfm_df = pd.read_csv(file_path)
@@ -45,10 +27,15 @@ def load_rfm_data(file_path):
             'monetary': 'Monetary',
             'segment': 'Segment'
         }, inplace=True)
-        return rfm_df
+        rfm_agg = rfm_df.groupby('Segment', observed=True).agg(
+            count=('Segment', 'size'),
+            freq_mean=('Frequency', 'mean'),
+            mon_sum=('Monetary', 'sum')
+        ).sort_values('count', ascending=False).reset_index()
+        return rfm_df, rfm_agg
     except Exception as e:
         st.error(f"Error loading RFM data from '{file_path}': {e}")
-        return None
+        return None, None
 
 # --- Main Application ---
 def main():
@@ -57,18 +44,19 @@ def main():
     # --- UPDATED ORDER: General Sales Dashboard now comes first ---
 
     # --- Load Sales Data ---
-    df = load_sales_data('combined_data.csv')
+    sales_file = 'combined_data.csv'
+    sales_data = load_retail(sales_file)
 
     # --- General Sales Dashboard Section ---
-    if df is not None:
+    if sales_data is not None:
+        all_countries = sales_data['countries']
         st.header("General Sales Dashboard")
 
         with st.expander("📊 Adjust Sales Data Filters", expanded=True):
-            all_countries = sorted(df['Country'].unique())
             select_all = st.checkbox("Select All / Deselect All Countries", value=True)
 
             if select_all:
-                default_selection = all_countries
+                default_selection = list(all_countries)
             else:
                 default_selection = ['United Kingdom'] if 'United Kingdom' in all_countries else []
 
@@ -82,13 +70,16 @@ def main():
             st.warning("Please select at least one country to view the sales dashboard.")
             st.stop()
 
-        filtered_df = df[df['Country'].isin(selected_countries)]
+        if len(selected_countries) == len(all_countries):
+            summary = sales_data['cubes']['all']
+        else:
+            summary = summarize_selection(sales_data['cubes'], sales_data['key'], tuple(sorted(selected_countries)))
 
         st.subheader("Key Performance Indicators (KPIs)")
-        total_revenue = filtered_df['TotalPrice'].sum()
-        total_orders = filtered_df['Invoice'].nunique()
-        unique_customers = filtered_df['Customer ID'].nunique()
-        total_items_sold = filtered_df['Quantity'].sum()
+        total_revenue = summary['revenue']
+        total_orders = summary['orders']
+        unique_customers = summary['customers']
+        total_items_sold = summary['items']
 
         kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
         kpi_col1.metric("Total Revenue", f"£{total_revenue:,.2f}")
@@ -99,33 +90,55 @@ def main():
         st.markdown("---")
 
         st.subheader("Sales Trends and Breakdowns")
-        monthly_sales = filtered_df.groupby('InvoiceMonth')['TotalPrice'].sum().reset_index().sort_values('InvoiceMonth')
-        fig_monthly = px.line(monthly_sales, x='InvoiceMonth', y='TotalPrice', title='Total Revenue Over Time', markers=True)
+        monthly_sales = summary['monthly']
+        fig_monthly = px.line(
+            x=monthly_sales.index.astype(str).to_numpy(),
+            y=np.ascontiguousarray(monthly_sales.values),
+            labels={'x': 'InvoiceMonth', 'y': 'TotalPrice'},
+            title='Total Revenue Over Time',
+            markers=True
+        )
         fig_monthly.update_layout(xaxis={'type': 'category'})
         st.plotly_chart(fig_monthly, use_container_width=True)
 
         viz_col1, viz_col2 = st.columns(2)
         with viz_col1:
-            top_products = filtered_df.groupby('Description')['Quantity'].sum().nlargest(10).reset_index()
+            top_products = summary['products'].reset_index()
             fig_products = px.bar(top_products, x='Quantity', y='Description', orientation='h', title='Top 10 Products by Quantity Sold')
             fig_products.update_layout(yaxis={'categoryorder':'total ascending'})
             st.plotly_chart(fig_products, use_container_width=True)
 
         with viz_col2:
-            daily_sales = filtered_df.groupby('DayOfWeek')['TotalPrice'].sum().reset_index()
+            daily_sales = summary['daily']
             days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            daily_sales['DayOfWeek'] = pd.Categorical(daily_sales['DayOfWeek'], categories=days_order, ordered=True)
-            daily_sales = daily_sales.sort_values('DayOfWeek')
-            fig_daily = px.bar(daily_sales, x='DayOfWeek', y='TotalPrice', title='Total Revenue by Day of the Week')
+            fig_daily = px.bar(
+                x=[days_order[day] for day in daily_sales.index],
+                y=np.ascontiguousarray(daily_sales.values),
+                labels={'x': 'DayOfWeek', 'y': 'TotalPrice'},
+                title='Total Revenue by Day of the Week'
+            )
             st.plotly_chart(fig_daily, use_container_width=True)
 
+        show_filtered_data = st.checkbox("Show Filtered Data")
+        if show_filtered_data:
+            display_cols = ['InvoiceDate', 'Invoice', 'Description', 'Quantity', 'Price', 'TotalPrice', 'Country']
+            st.dataframe(
+                filter_preview(sales_data['df'], selected_countries, display_cols),
+                use_container_width=True
+            )
+
+        show_raw_data = st.checkbox("Show Original Raw Data")
+        if show_raw_data:
+            raw_rows = st.number_input("Rows to preview", min_value=10, max_value=1000, value=100, step=10)
+            st.dataframe(load_raw_head(sales_file, int(raw_rows)), use_container_width=True)
+
         st.markdown("---")
 
 
     # --- UPDATED ORDER: RFM Customer Segmentation Analysis now comes second ---
 
     # --- Load RFM Data ---
-    rfm_df = load_rfm_data('rfm.csv')
+    rfm_df, rfm_agg = load_rfm_data('rfm.csv')
 
     # --- RFM Customer Segmentation Analysis Section ---
     if rfm_df is not None:
@@ -141,17 +154,16 @@ def main():
 
         st.subheader("Customer Segment Distribution")
         dist_col1, dist_col2 = st.columns(2)
-        segment_counts = rfm_df['Segment'].value_counts()
 
         with dist_col1:
             fig_segment_bar = px.bar(
-                segment_counts,
-                x=segment_counts.index,
-                y=segment_counts.values,
-                color=segment_counts.index,
+                rfm_agg,
+                x='Segment',
+                y='count',
+                color='Segment',
                 color_discrete_map=color_map,
                 title="Number of Customers in Each Segment",
-                labels={'x': 'Segment', 'y': 'Number of Customers'}
+                labels={'Segment': 'Segment', 'count': 'Number of Customers'}
             )
             fig_segment_bar.update_layout(xaxis={'categoryorder':'array', 'categoryarray': [
                 'hibernating', 'loyal_customers', 'champions', 'at_risk',
@@ -162,10 +174,10 @@ def main():
 
         with dist_col2:
             fig_segment_pie = px.pie(
-                segment_counts,
-                names=segment_counts.index,
-                values=segment_counts.values,
-                color=segment_counts.index,
+                rfm_agg,
+                names='Segment',
+                values='count',
+                color='Segment',
                 color_discrete_map=color_map,
                 title="Percentage of Customers in Each Segment",
                 hole=0.3
@@ -177,9 +189,9 @@ def main():
         st.subheader("Segment Value and Behavior Analysis")
 
         fig_treemap = px.treemap(
-            rfm_df,
+            rfm_agg,
             path=[px.Constant("All Customers"), 'Segment'],
-            values='Monetary',
+            values='mon_sum',
             color='Segment',
             color_discrete_map=color_map,
             title='Total Monetary Value Contribution by Segment'
@@ -191,7 +203,7 @@ def main():
         fig_treemap.update_layout(margin=dict(t=50, l=25, r=25, b=25))
         st.plotly_chart(fig_treemap, use_container_width=True)
 
-        mean_freq = rfm_df.groupby('Segment')['Frequency'].mean().reset_index()
+        mean_freq = rfm_agg[['Segment', 'freq_mean']].rename(columns={'freq_mean': 'Frequency'})
         custom_order = [
             'hibernating', 'loyal_customers', 'champions', 'at_risk',
             'potential_loyalists', 'about_to_sleep', 'need_attention',
@@ -200,22 +212,12 @@ def main():
         mean_freq['Segment'] = pd.Categorical(mean_freq['Segment'], categories=custom_order, ordered=True)
         mean_freq = mean_freq.sort_values('Segment')
         
-        sorted_freq = mean_freq.sort_values(by='Frequency', ascending=False)
-        max_freq = mean_freq['Frequency'].max()
-        min_freq = mean_freq['Frequency'].min()
-        
-        highest_segments = mean_freq[mean_freq['Frequency'] == max_freq]['Segment'].tolist()
-        lowest_segments = mean_freq[mean_freq['Frequency'] == min_freq]['Segment'].tolist()
-
-        def assign_color_group(segment):
-            if segment in highest_segments:
-                return 'Highest Frequency'
-            elif segment in lowest_segments:
-                return 'Lowest Frequency'
-            else:
-                return 'Mid-Range'
-
-        mean_freq['ColorGroup'] = mean_freq['Segment'].apply(assign_color_group)
+        freq = mean_freq['Frequency'].to_numpy()
+        mean_freq['ColorGroup'] = np.select(
+            [freq == freq.max(), freq == freq.min()],
+            ['Highest Frequency', 'Lowest Frequency'],
+            default='Mid-Range'
+        )
         
         freq_color_map = {
             'Highest Frequency': 'mediumseagreen',